@@ -1,9 +1,21 @@
 import os
 import json
+import time
+import asyncio
 import logging
-from openai import OpenAI
-from typing import Dict, Any, Union
-from config import OPENAI_API_KEY, OPENAI_MODEL, OPENAI_MAX_TOKENS, DAILY_ANALYSIS_PROMPT, WEEKLY_ANALYSIS_PROMPT
+import hashlib
+import openai
+import streamlit as st
+from openai import OpenAI, AsyncOpenAI
+from pathlib import Path
+from typing import Dict, Any, Optional, Union
+from config import (
+    OPENAI_API_KEY, OPENAI_MODEL, OPENAI_MAX_TOKENS, OPENAI_MAX_CONCURRENCY,
+    OPENAI_MAX_RETRIES, OPENAI_BATCH_POLL_SECONDS, OPENAI_BATCH_MAX_WAIT_SECONDS,
+    DAILY_PROMPT_PREFIX, DAILY_PROMPT_SUFFIX, WEEKLY_PROMPT_PREFIX, WEEKLY_PROMPT_SUFFIX,
+    AI_CACHE_DIR
+)
+from utils import json_dumps
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -14,49 +26,311 @@ if OPENAI_API_KEY:
 else:
     client = None
 
+# Transient failures worth retrying with backoff
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError,
+                    openai.APITimeoutError, openai.InternalServerError)
+
+MISSING_KEY_ERROR = {"error": "API Key Missing", "message": "OPENAI_API_KEY not found in environment variables."}
+
+class _UncachedResult(Exception):
+    """Raised from the memoized call so error results are returned but never cached."""
+    def __init__(self, result: Dict[str, Any]):
+        super().__init__(result.get("message"))
+        self.result = result
+
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _format_payload(data: Dict) -> str:
+    """Compact JSON for the prompt: fewer tokens than a Python repr, and sorted keys keep cache keys stable."""
+    return json_dumps(data, sort_keys=True).decode()
+
+
+def _is_analysis(result: Any) -> bool:
+    """True for a daily or weekly analysis object (see the prompts in config.py)."""
+    return (isinstance(result, dict) and "wellness_score" in result
+            and ("summary" in result or "trend_analysis" in result))
+
+
+def _parse_response(content: str) -> Dict[str, Any]:
+    """
+    Parse the analysis object in the model's reply, falling back to an error dict.
+    raw_decode parses in place from the first '{', so markdown ticks or chatter
+    around the object need no cleanup copies. Only a top-level analysis is accepted:
+    in a truncated reply a later '{' may open a nested object (e.g. one trigger),
+    which must not pass for the whole result.
+    """
+    content = content or ""
+    start = content.find("{")
+    while start != -1:
+        try:
+            result, end = _JSON_DECODER.raw_decode(content, start)
+        except json.JSONDecodeError:
+            # A stray brace in leading text; try the next one
+            start = content.find("{", start + 1)
+            continue
+        if _is_analysis(result):
+            return result
+        # Some other complete object: skip it whole, never its nested objects
+        start = content.find("{", end)
+
+    logger.error(f"Failed to parse JSON: {content}")
+    return {"error": "Parsing Error", "raw_content": content, "message": "AI returned unstructured text."}
+
+
+def _parse_completion(content: str, finish_reason: Optional[str]) -> Dict[str, Any]:
+    """_parse_response for one choice; a reply cut off at the token limit is a parse error."""
+    if finish_reason == "length":
+        logger.error(f"AI reply truncated at {OPENAI_MAX_TOKENS} tokens: {content}")
+        return {"error": "Parsing Error", "raw_content": content or "",
+                "message": "AI reply was cut off before it finished."}
+    return _parse_response(content)
+
+
+def _disk_cache_path(model: str, prompt: str) -> Path:
+    digest = hashlib.sha256(f"{model}\n{prompt}".encode()).hexdigest()
+    return AI_CACHE_DIR / f"{digest}.json"
+
+
+def _read_disk_cache(model: str, prompt: str) -> Optional[Dict[str, Any]]:
+    """Return a previously stored analysis for this exact prompt, if any."""
+    try:
+        with open(_disk_cache_path(model, prompt), 'r') as f:
+            cached = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable AI cache entry: {e}")
+        return None
+    if not _is_analysis(cached):
+        logger.warning("Ignoring AI cache entry that is not a complete analysis")
+        return None
+    return cached
+
+
+def _write_disk_cache(model: str, prompt: str, result: Dict[str, Any]) -> None:
+    """
+    Store a successful analysis; failures only cost a future API call. Entries
+    never expire, so anything that isn't a complete analysis is never written.
+    """
+    if not _is_analysis(result):
+        return
+    try:
+        AI_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(_disk_cache_path(model, prompt), 'w') as f:
+            json.dump(result, f)
+    except Exception as e:
+        logger.warning(f"Could not write AI cache entry: {e}")
+
+
+@st.cache_data(ttl=86400, show_spinner=False)
+def _cached_completion(model: str, prompt: str) -> Dict[str, Any]:
+    """
+    Memoized completion keyed on (model, prompt), backed by data/ai_cache/ so
+    results survive restarts. The prompt embeds the day's data, so editing an
+    entry naturally produces a new key.
+    """
+    cached = _read_disk_cache(model, prompt)
+    if cached is not None:
+        return cached
+
+    try:
+        # New version
+        response = client.chat.completions.create(
+            model=model,
+            max_completion_tokens=OPENAI_MAX_TOKENS,
+            messages=[{"role": "user", "content": prompt}]
+        )
+    except TypeError:
+        # Old version fallback
+        response = client.chat.completions.create(
+            model=model,
+            max_tokens=OPENAI_MAX_TOKENS,
+            messages=[{"role": "user", "content": prompt}]
+        )
+
+    choice = response.choices[0]
+    result = _parse_completion(choice.message.content, choice.finish_reason)
+    if not _is_analysis(result):
+        raise _UncachedResult(result)
+    _write_disk_cache(model, prompt, result)
+    return result
+
+
 class AIAnalyzer:
     def _call_openai(self, prompt: str) -> Union[Dict[str, Any], str]:
         """Helper to call OpenAI and parse JSON response."""
         if not client:
-            return {"error": "API Key Missing", "message": "OPENAI_API_KEY not found in environment variables."}
+            return dict(MISSING_KEY_ERROR)
             
         try:
-            try:
-                # New version
-                response = client.chat.completions.create(
-                    model=OPENAI_MODEL,
-                    max_completion_tokens=OPENAI_MAX_TOKENS,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-            except TypeError:
-                # Old version fallback
-                response = client.chat.completions.create(
-                    model=OPENAI_MODEL,
-                    max_tokens=OPENAI_MAX_TOKENS,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-            
-            content = response.choices[0].message.content
-            
-            # Attempt to parse JSON
-            try:
-                # simple cleanup if model returns markdown ticks
-                cleaned_content = content.replace("```json", "").replace("```", "").strip()
-                return json.loads(cleaned_content)
-            except json.JSONDecodeError:
-                logger.error(f"Failed to parse JSON: {content}")
-                return {"error": "Parsing Error", "raw_content": content, "message": "AI returned unstructured text."}
-                
+            return _cached_completion(OPENAI_MODEL, prompt)
+        except _UncachedResult as e:
+            return e.result
         except Exception as e:
             logger.error(f"OpenAI API Error: {e}")
             return {"error": "API Error", "message": str(e)}
 
+    def _request_body(self, prompt: str) -> Dict[str, Any]:
+        """Chat completion parameters shared by the async and batch paths."""
+        return {
+            "model": OPENAI_MODEL,
+            "max_completion_tokens": OPENAI_MAX_TOKENS,
+            "messages": [{"role": "user", "content": prompt}]
+        }
+
+    async def _call_openai_async(self, aclient: AsyncOpenAI, prompt: str) -> Dict[str, Any]:
+        """Async variant of _call_openai with exponential-backoff retries."""
+        cached = _read_disk_cache(OPENAI_MODEL, prompt)
+        if cached is not None:
+            return cached
+
+        for attempt in range(OPENAI_MAX_RETRIES):
+            try:
+                response = await aclient.chat.completions.create(**self._request_body(prompt))
+                choice = response.choices[0]
+                result = _parse_completion(choice.message.content, choice.finish_reason)
+                _write_disk_cache(OPENAI_MODEL, prompt, result)
+                return result
+            except RETRYABLE_ERRORS as e:
+                if attempt == OPENAI_MAX_RETRIES - 1:
+                    logger.error(f"OpenAI API Error after {OPENAI_MAX_RETRIES} attempts: {e}")
+                    return {"error": "API Error", "message": str(e)}
+                await asyncio.sleep(2 ** attempt)
+            except Exception as e:
+                logger.error(f"OpenAI API Error: {e}")
+                return {"error": "API Error", "message": str(e)}
+
+    async def _analyze_days_async(self, entries: Dict[str, Dict]) -> Dict[str, Dict[str, Any]]:
+        semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+
+        # A fresh client per run: each asyncio.run() gets its own event loop
+        async with AsyncOpenAI(api_key=OPENAI_API_KEY) as aclient:
+            async def analyze(date: str, entry: Dict):
+                async with semaphore:
+                    prompt = f"{DAILY_PROMPT_PREFIX}{_format_payload(entry)}{DAILY_PROMPT_SUFFIX}"
+                    return date, await self._call_openai_async(aclient, prompt)
+
+            results = await asyncio.gather(*(analyze(d, e) for d, e in entries.items()))
+        return dict(results)
+
     def analyze_daily(self, data: Dict) -> Dict[str, Any]:
         """Analyze a single day's data returning structured JSON."""
-        prompt = DAILY_ANALYSIS_PROMPT.format(data=str(data))
+        prompt = f"{DAILY_PROMPT_PREFIX}{_format_payload(data)}{DAILY_PROMPT_SUFFIX}"
         return self._call_openai(prompt)
 
     def analyze_weekly(self, data: Dict) -> Dict[str, Any]:
         """Analyze multiple days of data returning structured JSON."""
-        prompt = WEEKLY_ANALYSIS_PROMPT.format(data=str(data))
+        prompt = f"{WEEKLY_PROMPT_PREFIX}{_format_payload(data)}{WEEKLY_PROMPT_SUFFIX}"
         return self._call_openai(prompt)
+
+    def analyze_days(self, entries: Dict[str, Dict]) -> Dict[str, Dict[str, Any]]:
+        """Analyze several days concurrently, returning {date: daily result}."""
+        if not client:
+            return {date: dict(MISSING_KEY_ERROR) for date in entries}
+        return asyncio.run(self._analyze_days_async(entries))
+
+    def _daily_prompts(self, entries: Dict[str, Dict]) -> Dict[str, str]:
+        return {date: f"{DAILY_PROMPT_PREFIX}{_format_payload(entry)}{DAILY_PROMPT_SUFFIX}"
+                for date, entry in entries.items()}
+
+    def analyze_days_batch(self, entries: Dict[str, Dict],
+                           max_wait: float = OPENAI_BATCH_MAX_WAIT_SECONDS) -> Dict[str, Dict[str, Any]]:
+        """
+        Analyze several days through the OpenAI Batch API.
+        Cheaper than analyze_days for large backfills, but results can take a while,
+        so this polls for at most `max_wait` seconds. Days still running come back as
+        "Batch Pending" errors carrying the batch_id; pass it to collect_batch later.
+        """
+        if not client:
+            return {date: dict(MISSING_KEY_ERROR) for date in entries}
+
+        prompts = self._daily_prompts(entries)
+        try:
+            batch_lines = "\n".join(json.dumps({
+                "custom_id": date,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": self._request_body(prompt)
+            }) for date, prompt in prompts.items())
+
+            batch_file = client.files.create(file=("ibs_batch.jsonl", batch_lines.encode()), purpose="batch")
+            batch = client.batches.create(input_file_id=batch_file.id,
+                                          endpoint="/v1/chat/completions",
+                                          completion_window="24h")
+            logger.info(f"Submitted batch {batch.id} for {len(entries)} days")
+        except Exception as e:
+            logger.error(f"OpenAI Batch API Error: {e}")
+            return {date: {"error": "API Error", "message": str(e)} for date in entries}
+
+        return self._finish_batch(batch, prompts, max_wait)
+
+    def collect_batch(self, batch_id: str, entries: Dict[str, Dict],
+                      max_wait: float = 0) -> Dict[str, Dict[str, Any]]:
+        """
+        Collect a batch submitted by analyze_days_batch without paying for it again.
+        `entries` must be the ones submitted; by default this checks once and doesn't wait.
+        """
+        if not client:
+            return {date: dict(MISSING_KEY_ERROR) for date in entries}
+        try:
+            batch = client.batches.retrieve(batch_id)
+        except Exception as e:
+            logger.error(f"OpenAI Batch API Error: {e}")
+            return {date: {"error": "API Error", "message": str(e)} for date in entries}
+        return self._finish_batch(batch, self._daily_prompts(entries), max_wait)
+
+    def _finish_batch(self, batch, prompts: Dict[str, str], max_wait: float) -> Dict[str, Dict[str, Any]]:
+        """Poll `batch` for up to `max_wait` seconds, then map its output back to {date: result}."""
+        try:
+            deadline = time.monotonic() + max_wait
+            while batch.status in ("validating", "in_progress", "finalizing"):
+                if time.monotonic() >= deadline:
+                    message = f"Batch {batch.id} still {batch.status}; collect it later with collect_batch."
+                    return {date: {"error": "Batch Pending", "batch_id": batch.id, "message": message}
+                            for date in prompts}
+                time.sleep(OPENAI_BATCH_POLL_SECONDS)
+                batch = client.batches.retrieve(batch.id)
+
+            if batch.status != "completed" or not batch.output_file_id:
+                message = f"Batch {batch.id} ended with status '{batch.status}'."
+                logger.error(message)
+                return {date: {"error": "API Error", "message": message} for date in prompts}
+
+            output = client.files.content(batch.output_file_id).text
+        except Exception as e:
+            logger.error(f"OpenAI Batch API Error: {e}")
+            return {date: {"error": "API Error", "message": str(e)} for date in prompts}
+
+        results = {}
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            # One malformed line only costs its own day
+            try:
+                record = json.loads(line)
+                date = record["custom_id"]
+            except (json.JSONDecodeError, KeyError, TypeError) as e:
+                logger.error(f"Skipping unreadable batch output line: {e}")
+                continue
+            if date not in prompts:
+                continue
+            try:
+                response = record.get("response") or {}
+                if record.get("error") or response.get("status_code") != 200:
+                    message = str(record.get("error") or response.get("body"))
+                    results[date] = {"error": "API Error", "message": message}
+                else:
+                    choice = response["body"]["choices"][0]
+                    results[date] = _parse_completion(choice["message"]["content"],
+                                                      choice.get("finish_reason"))
+                    _write_disk_cache(OPENAI_MODEL, prompts[date], results[date])
+            except (KeyError, IndexError, TypeError, AttributeError) as e:
+                logger.error(f"Malformed batch result for {date}: {e}")
+                results[date] = {"error": "API Error", "message": f"Malformed batch result: {e}"}
+
+        # Requests that never made it into the output file
+        for date in prompts:
+            results.setdefault(date, {"error": "API Error", "message": "No result returned for this day."})
+        return results
@@ -1,133 +1,176 @@
+import hashlib
 import streamlit as st
 import pandas as pd
 from datetime import datetime
+from typing import Dict
 from config import (
     SEVERITY_LABELS, SLEEP_QUALITY_LABELS, STRESS_LEVEL_LABELS,
-    BRISTOL_SCALE, MEAL_SPEED_OPTIONS, STRESS_TYPE_OPTIONS
+    BRISTOL_OPTS, SYMPTOM_OPTIONS, MEAL_SPEED_OPTIONS, STRESS_TYPE_OPTIONS
 )
-from data_manager import DataManager
-from ai_analysis import AIAnalyzer
-from visualizations import Visualizer
-from utils import (get_today_key, get_trigger_foods, convert_to_dataframe, 
-                   get_csv_export, validate_entry)
-
-# Initialize modules
-# Use st.cache_resource for these if they were expensive to init, but they are lightweight
-data_manager = DataManager()
-ai_analyzer = AIAnalyzer()
-visualizer = Visualizer()
+from data_manager import DataManager, get_dashboard_frame
+from utils import (get_today_key, get_trigger_foods,
+                   get_csv_export, validate_entry, json_dumps)
 
+# Must be the first Streamlit command
 st.set_page_config(page_title="IBS Wellness Tracker", page_icon="🧘", layout="wide")
 
+# Initialize modules once per server process rather than on every rerun;
+# DataManager probes secrets and may open a Google Sheets connection
+@st.cache_resource
+def get_data_manager():
+    return DataManager()
+
+data_manager = get_data_manager()
+
+# openai and plotly are slow to import, so only pages that need them pay for it
+@st.cache_resource
+def get_ai_analyzer():
+    from ai_analysis import AIAnalyzer
+    return AIAnalyzer()
+
+@st.cache_resource
+def get_visualizer():
+    from visualizations import Visualizer
+    return Visualizer()
+
+@st.fragment
+def severity_block(default: int) -> int:
+    """Severity slider with its live status label."""
+    severity = st.slider("Symptom Severity (1-10)", 1, 10, value=default, help="1=Minimal, 10=Unbearable")
+    
+    # Dynamic Label - Updates immediately on interaction
+    sev_label = SEVERITY_LABELS.get(int(severity), "Unknown")
+    if severity <= 3:
+        st.success(f"Status: **{sev_label}**")
+    elif severity <= 7:
+        st.warning(f"Status: **{sev_label}**")
+    else:
+        st.error(f"Status: **{sev_label}**")
+    return severity
+
+@st.fragment
+def stress_block(default: int) -> int:
+    """Stress slider with its live status label."""
+    stress = st.slider("Stress Level (1-10)", 1, 10, value=default, help="1=Zen, 10=Panic")
+    stress_label = STRESS_LEVEL_LABELS.get(int(stress), "Unknown")
+    
+    if stress <= 4:
+        st.success(f"Status: **{stress_label}**")
+    elif stress <= 7:
+        st.warning(f"Status: **{stress_label}**")
+    else:
+        st.error(f"Status: **{stress_label}**")
+    return stress
+
+@st.fragment
+def sleep_quality_block(default: int) -> int:
+    """Sleep quality slider with its live status label."""
+    sleep_quality = st.slider("Sleep Quality (1-10)", 1, 10, value=default)
+    sq_label = SLEEP_QUALITY_LABELS.get(int(sleep_quality), "Unknown")
+    if sleep_quality >= 8:
+        st.success(f"Status: **{sq_label}**")
+    elif sleep_quality >= 5:
+        st.warning(f"Status: **{sq_label}**")
+    else:
+        st.error(f"Status: **{sq_label}**")
+    return sleep_quality
+
+@st.cache_data(ttl=60, show_spinner=False)
+def cached_csv_export(version: int, keys_digest: str, _data: Dict) -> bytes:
+    """CSV bytes for the History download; `version` and `keys_digest` key the cache."""
+    return get_csv_export(_data)
+
 def page_todays_log():
     st.header("📝 Today's Log")
     today_key = get_today_key()
     
-    # Check for existing data
-    existing_data = data_manager.get_entry(today_key)
+    # Check for existing data (cached per session and day, refetched whenever the
+    # store changes, e.g. a delete in History or a save from another session)
+    entry_key = f"entry_{today_key}"
+    version = data_manager.data_version()
+    cached = st.session_state.get(entry_key)
+    if cached is None or cached[0] != version:
+        entries = data_manager.get_entries([today_key])
+        st.session_state[entry_key] = (version, entries.get(today_key, {}))
+    existing_data = st.session_state[entry_key][1]
     
-    # BLOCK 1: Physical Symptoms
-    st.subheader("1. 🩺 Physical Symptoms")
-    with st.expander("Symptom Details", expanded=True):
-        # Reactive Slider (No Form)
-        severity = st.slider("Symptom Severity (1-10)", 1, 10, value=int(existing_data.get("symptom_severity", 1)), help="1=Minimal, 10=Unbearable")
-        
-        # Dynamic Label - Updates immediately on interaction
-        sev_label = SEVERITY_LABELS.get(int(severity), "Unknown")
-        if severity <= 3:
-            st.success(f"Status: **{sev_label}**")
-        elif severity <= 7:
-            st.warning(f"Status: **{sev_label}**")
-        else:
-            st.error(f"Status: **{sev_label}**")
-        
-        symptoms = st.multiselect(
-            "Specific Symptoms",
-            ["Bloating", "Abdominal Pain", "Gas", "Constipation", "Diarrhea", 
-                "Nausea", "Heartburn", "Incomplete Evacuation", "Urgency"],
-            default=existing_data.get("symptoms", [])
-        )
+    # Ratings stay outside the form so their status labels update immediately;
+    # each is a fragment, so dragging a slider only reruns that block
+    st.subheader("⚡ Today's Ratings")
+    c_sev, c_stress, c_sleep = st.columns(3)
+    with c_sev:
+        severity = severity_block(int(existing_data.get("symptom_severity", 1)))
+    with c_stress:
+        stress = stress_block(int(existing_data.get("stress_level", 3)))
+    with c_sleep:
+        sleep_quality = sleep_quality_block(int(existing_data.get("sleep_quality", 7)))
 
-    # BLOCK 2: Bowel Health
-    st.subheader("2. 🚽 Bowel Health")
-    with st.expander("Stool Details", expanded=True):
-        # Bristol Scale Dropdown
-        bristol_opts = [f"{k} - {v}" for k,v in BRISTOL_SCALE.items()]
-        current_stool = existing_data.get("stool_type", 3)
-        try:
-            default_idx = current_stool - 1
-        except:
-            default_idx = 2
-        
-        stool_type_raw = st.selectbox("Bristol Stool Type", options=bristol_opts, index=default_idx)
-        stool_type = int(stool_type_raw.split(" - ")[0])
-        
-        bowel_movements = st.number_input("Bowel Movements Today", min_value=0, max_value=10, value=int(existing_data.get("bowel_movements", 1)))
+    # Everything else is batched in a form: editing these fields doesn't rerun the script
+    with st.form("daily_log"):
+        # BLOCK 1: Physical Symptoms
+        st.subheader("1. 🩺 Physical Symptoms")
+        with st.expander("Symptom Details", expanded=True):
+            symptoms = st.multiselect(
+                "Specific Symptoms",
+                SYMPTOM_OPTIONS,
+                default=existing_data.get("symptoms", [])
+            )
 
-    # BLOCK 3: Mental Well-being
-    st.subheader("3. 🧠 Mental Well-being")
-    with st.expander("Stress & Sleep", expanded=True):
-        stress = st.slider("Stress Level (1-10)", 1, 10, value=int(existing_data.get("stress_level", 3)), help="1=Zen, 10=Panic")
-        stress_label = STRESS_LEVEL_LABELS.get(int(stress), "Unknown")
-        
-        if stress <= 4:
-            st.success(f"Status: **{stress_label}**")
-        elif stress <= 7:
-            st.warning(f"Status: **{stress_label}**")
-        else:
-            st.error(f"Status: **{stress_label}**")
-        
-        current_stress_type = existing_data.get("stress_type", "None")
-        try:
-            st_idx = STRESS_TYPE_OPTIONS.index(current_stress_type)
-        except:
-            st_idx = 0
-        stress_type = st.selectbox("Stress Context", STRESS_TYPE_OPTIONS, index=st_idx)
-        
-        st.markdown("---")
-        
-        c_sleep1, c_sleep2 = st.columns(2)
-        with c_sleep1:
-            sleep_hours = st.number_input("Sleep Duration (Hours)", 0.0, 24.0, value=float(existing_data.get("sleep_hours", 7.0)), step=0.5)
-        with c_sleep2:
-            sleep_quality = st.slider("Sleep Quality (1-10)", 1, 10, value=int(existing_data.get("sleep_quality", 7)))
-            sq_label = SLEEP_QUALITY_LABELS.get(int(sleep_quality), "Unknown")
-            if sleep_quality >= 8:
-                st.success(f"Status: **{sq_label}**")
-            elif sleep_quality >= 5:
-                st.warning(f"Status: **{sq_label}**")
-            else:
-                st.error(f"Status: **{sq_label}**")
+        # BLOCK 2: Bowel Health
+        st.subheader("2. 🚽 Bowel Health")
+        with st.expander("Stool Details", expanded=True):
+            # Bristol Scale Dropdown
+            current_stool = existing_data.get("stool_type", 3)
+            try:
+                default_idx = current_stool - 1
+            except:
+                default_idx = 2
+            
+            stool_type_raw = st.selectbox("Bristol Stool Type", options=BRISTOL_OPTS, index=default_idx)
+            stool_type = int(stool_type_raw.split(" - ")[0])
+            
+            bowel_movements = st.number_input("Bowel Movements Today", min_value=0, max_value=10, value=int(existing_data.get("bowel_movements", 1)))
 
-    # BLOCK 4: Lifestyle & Diet
-    st.subheader("4. 🥗 Lifestyle & Diet")
-    with st.expander("Diet & Habits", expanded=True):
-        diet_notes = st.text_area("Diet Notes (Meals, Triggers?)", 
-                                value=existing_data.get("diet_notes", ""),
-                                height=100)
-        
-        c_life1, c_life2 = st.columns(2)
-        with c_life1:
-            # Meal Speed
-            current_speed = existing_data.get("meal_speed", MEAL_SPEED_OPTIONS[1])
+        # BLOCK 3: Mental Well-being
+        st.subheader("3. 🧠 Mental Well-being")
+        with st.expander("Stress & Sleep", expanded=True):
+            current_stress_type = existing_data.get("stress_type", "None")
             try:
-                speed_idx = MEAL_SPEED_OPTIONS.index(current_speed)
+                st_idx = STRESS_TYPE_OPTIONS.index(current_stress_type)
             except:
-                speed_idx = 1
-            meal_speed = st.selectbox("Avg. Eating Speed", MEAL_SPEED_OPTIONS, index=speed_idx)
+                st_idx = 0
+            stress_type = st.selectbox("Stress Context", STRESS_TYPE_OPTIONS, index=st_idx)
             
-            ex_mins = existing_data.get("exercise", 0)
-            exercise = st.checkbox("Did you exercise today?", value=ex_mins > 0)
-            if exercise:
-                exercise_mins = st.number_input("Duration (mins)", 10, 180, value=ex_mins if ex_mins > 0 else 30)
-            else:
-                exercise_mins = 0
+            st.markdown("---")
+            
+            sleep_hours = st.number_input("Sleep Duration (Hours)", 0.0, 24.0, value=float(existing_data.get("sleep_hours", 7.0)), step=0.5)
+
+        # BLOCK 4: Lifestyle & Diet
+        st.subheader("4. 🥗 Lifestyle & Diet")
+        with st.expander("Diet & Habits", expanded=True):
+            diet_notes = st.text_area("Diet Notes (Meals, Triggers?)", 
+                                    value=existing_data.get("diet_notes", ""),
+                                    height=100)
+            
+            c_life1, c_life2 = st.columns(2)
+            with c_life1:
+                # Meal Speed
+                current_speed = existing_data.get("meal_speed", MEAL_SPEED_OPTIONS[1])
+                try:
+                    speed_idx = MEAL_SPEED_OPTIONS.index(current_speed)
+                except:
+                    speed_idx = 1
+                meal_speed = st.selectbox("Avg. Eating Speed", MEAL_SPEED_OPTIONS, index=speed_idx)
+                
+                # Widgets inside a form can't show/hide each other, so 0 means no exercise
+                exercise_mins = st.number_input("Exercise Duration (mins, 0 = none)", 0, 180, value=int(existing_data.get("exercise", 0)))
 
-        with c_life2:
-            water_intake = st.number_input("Water Intake (Liters)", 0.0, 5.0, value=float(existing_data.get("water_intake", 2.0)), step=0.5)
+            with c_life2:
+                water_intake = st.number_input("Water Intake (Liters)", 0.0, 5.0, value=float(existing_data.get("water_intake", 2.0)), step=0.5)
 
-    # Use regular button instead of form_submit_button
-    if st.button("Save Entry", type="primary", use_container_width=True):
+        submitted = st.form_submit_button("Save Entry", type="primary", use_container_width=True)
+
+    if submitted:
         entry_data = {
             "date": str(today_key),
             "symptom_severity": severity,
@@ -141,11 +184,12 @@ def page_todays_log():
             "diet_notes": diet_notes,
             "meal_speed": meal_speed,
             "water_intake": water_intake,
-            "exercise": exercise_mins if exercise else 0,
+            "exercise": exercise_mins,
             "timestamp": str(datetime.now())
         }
         
         if data_manager.save_entry(today_key, entry_data):
+            st.session_state[entry_key] = (data_manager.data_version(), entry_data)
             st.success("✅ Daily log saved successfully!")
             st.balloons()
         else:
@@ -153,7 +197,10 @@ def page_todays_log():
 
 def page_analytics():
     st.header("📊 Analytics")
-    stats = data_manager.get_statistics()
+    visualizer = get_visualizer()
+    # One load per data version feeds every chart below
+    dashboard = get_dashboard_frame(data_manager, data_manager.data_version(), get_today_key())
+    stats = dashboard.stats
     
     # Key Metrics
     c1, c2, c3 = st.columns(3)
@@ -161,25 +208,18 @@ def page_analytics():
     c2.metric("Avg Sleep", f"{stats.get('avg_sleep', 0)}h")
     c3.metric("Avg Stress", stats.get("avg_stress", 0))
     
-    # Load data for charts
-    range_data = data_manager.get_date_range(8) # Last 8 days
-    df = convert_to_dataframe(range_data)
+    # Last 8 days for the trend charts
+    df = dashboard.range_df
     
     st.subheader("Interactive Trends")
-    # New Plotly Charts
-    with st.expander("Symptom Severity", expanded=True):
-        st.plotly_chart(visualizer.create_symptom_chart(df), use_container_width=True)
-        
-    with st.expander("Sleep Patterns", expanded=True):
-        st.plotly_chart(visualizer.create_sleep_chart(df), use_container_width=True)
-        
-    with st.expander("Stress Levels", expanded=True):
-        st.plotly_chart(visualizer.create_stress_chart(df), use_container_width=True)
-        
+    # Symptoms, sleep and stress share one figure (and one date axis)
+    with st.expander("Symptoms, Sleep & Stress", expanded=True):
+        st.plotly_chart(visualizer.create_dashboard(df), use_container_width=True)
+
     st.subheader("🧩 Causal Analysis (Advanced)")
     
-    # Get processed data with lags
-    processed_df = data_manager.get_processed_data()
+    # Processed data with lags
+    processed_df = dashboard.processed_df
     
     if not processed_df.empty:
         # Lagged Correlation
@@ -200,7 +240,7 @@ def page_analytics():
     
     # Trigger Analysis
     st.subheader("Potential Triggers")
-    triggers = get_trigger_foods(range_data)
+    triggers = get_trigger_foods(df)
     if triggers:
         for date, meals in triggers.items():
             st.warning(f"**{date}** (High Severity): {meals}")
@@ -209,8 +249,9 @@ def page_analytics():
 
 def page_ai_analysis():
     st.header("🤖 Advanced AI Analysis")
+    ai_analyzer = get_ai_analyzer()
     
-    analysis_type = st.radio("Select Analysis Type", ["Daily", "Weekly"], horizontal=True)
+    analysis_type = st.radio("Select Analysis Type", ["Daily", "Weekly", "Day-by-Day"], horizontal=True)
     
     if st.button("Generate Insights", type="primary"):
         with st.spinner("Consulting AI Specialist..."):
@@ -222,13 +263,24 @@ def page_ai_analysis():
                 else:
                     result = ai_analyzer.analyze_daily(data)
                     _display_ai_output(result, is_daily=True)
-            else:
+            elif analysis_type == "Weekly":
                 data = data_manager.get_date_range(7)
                 if not data:
                     st.warning("No data found for the last 7 days.")
                 else:
                     result = ai_analyzer.analyze_weekly(data)
                     _display_ai_output(result, is_daily=False)
+            else:
+                data = data_manager.get_date_range(7)
+                if not data:
+                    st.warning("No data found for the last 7 days.")
+                else:
+                    # One concurrent request per day instead of sequential round-trips
+                    results = ai_analyzer.analyze_days(data)
+                    for date in sorted(results, reverse=True):
+                        st.subheader(f"📅 {date}")
+                        _display_ai_output(results[date], is_daily=True)
+                        st.divider()
 
 def _display_ai_output(result, is_daily=True):
     """Helper to display structured AI output."""
@@ -288,11 +340,11 @@ def page_history():
 
     # Download buttons
     c1, c2 = st.columns(2)
-    csv_data = get_csv_export(data)
+    keys_digest = hashlib.blake2b("\n".join(sorted(data)).encode(), digest_size=8).hexdigest()
+    csv_data = cached_csv_export(data_manager.data_version(), keys_digest, data)
     c1.download_button("Download CSV", csv_data, "ibs_data.csv", "text/csv")
     
-    import json
-    json_data = json.dumps(data, indent=2)
+    json_data = json_dumps(data, indent=True)
     c2.download_button("Download JSON", json_data, "ibs_data.json", "application/json")
     
     # Display entries
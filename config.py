@@ -8,6 +8,10 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = "gpt-4"
 OPENAI_MAX_TOKENS = 1000
+OPENAI_MAX_CONCURRENCY = 10  # parallel requests for multi-day analysis
+OPENAI_MAX_RETRIES = 3
+OPENAI_BATCH_POLL_SECONDS = 10
+OPENAI_BATCH_MAX_WAIT_SECONDS = 600
 
 # UI Labels & Mappings
 SEVERITY_LABELS = {
@@ -39,6 +43,14 @@ BRISTOL_SCALE = {
     7: "Type 7: Watery, no solid pieces (Severe Diarrhea)"
 }
 
+# Selectbox labels, built once at import
+BRISTOL_OPTS = [f"{k} - {v}" for k, v in BRISTOL_SCALE.items()]
+
+SYMPTOM_OPTIONS = [
+    "Bloating", "Abdominal Pain", "Gas", "Constipation", "Diarrhea",
+    "Nausea", "Heartburn", "Incomplete Evacuation", "Urgency"
+]
+
 MEAL_SPEED_OPTIONS = [
     "Slow / Mindful (20+ min)", 
     "Average (10-20 min)", 
@@ -55,8 +67,10 @@ STRESS_TYPE_OPTIONS = [
 ]
 
 # File Paths
-DATA_FILE = Path("data/ibs_data.json")
+DATA_FILE = Path("data/ibs_data.ndjson")  # append-only, one {date: entry} per line
+LEGACY_DATA_FILE = Path("data/ibs_data.json")  # pre-NDJSON store, migrated on first run
 LOG_FILE = Path("logs/app.log")
+AI_CACHE_DIR = Path("data/ai_cache")
 
 # Prompt Templates
 DAILY_ANALYSIS_PROMPT = """
@@ -92,3 +106,8 @@ Required JSON Structure:
     "recommendations": ["<strategic recommendation 1>", "<strategic recommendation 2>"]
 }}
 """
+
+# Templates pre-split around {data} at import so each call only concatenates the payload.
+# Formatting with a sentinel first resolves the {{ }} escapes.
+DAILY_PROMPT_PREFIX, DAILY_PROMPT_SUFFIX = DAILY_ANALYSIS_PROMPT.format(data="\0").split("\0")
+WEEKLY_PROMPT_PREFIX, WEEKLY_PROMPT_SUFFIX = WEEKLY_ANALYSIS_PROMPT.format(data="\0").split("\0")
@@ -1,10 +1,14 @@
+import os
 import json
 import logging
+import tempfile
+import threading
 import pandas as pd
 import streamlit as st
-from typing import Dict, Optional, List, Any
+from typing import Dict, Optional, List, Any, NamedTuple, Tuple
 from pathlib import Path
-from config import DATA_FILE, LOG_FILE
+from config import DATA_FILE, LEGACY_DATA_FILE, LOG_FILE
+from utils import json_loads, json_dumps
 # Try importing GSheets, but don't fail if strictly local dev without packages
 try:
     from streamlit_gsheets import GSheetsConnection
@@ -17,17 +21,110 @@ logging.basicConfig(filename=LOG_FILE, level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+
+# Rewrite the log once superseded lines outnumber live entries (and this many)
+COMPACT_MIN_STALE = 100
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _load_local(path: str, mtime: int) -> Tuple[Dict, int, int]:
+    """
+    Replay the local NDJSON log into {date: entry}; the last line for a date wins
+    and a null entry is a deletion. `mtime` is only part of the cache key.
+    Returns (data, lines read, unreadable lines).
+    """
+    data = {}
+    n_lines = n_bad = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            n_lines += 1
+            try:
+                record = json_loads(line)
+            except json.JSONDecodeError:
+                # Typically a write cut short by a crash; compaction drops it
+                n_bad += 1
+                continue
+            for date, entry in record.items():
+                if entry is None:
+                    data.pop(date, None)
+                else:
+                    data[date] = entry
+    if n_bad:
+        logger.warning(f"Skipped {n_bad} unreadable line(s) in {path}")
+    return data, n_lines, n_bad
+
+
+def _read_sheet(conn) -> Dict:
+    """Read Sheet1 straight from Google Sheets into {date: row}."""
+    # Read from Sheet 1. Expected format: Date col, other cols.
+    df = conn.read(worksheet="Sheet1", ttl=0)
+    if df.empty:
+        return {}
+
+    # Convert DF back to Dict logic {date: {row_data}}
+    # Ensure date column is string
+    if 'date' not in df.columns:
+        logger.warning("Google Sheet missing 'date' column.")
+        return {}
+
+    df['date'] = df['date'].astype(str)
+    # Convert to records
+    records = df.to_dict('records')
+    # Map to {date: record}
+    return {row['date']: row for row in records}
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _load_cloud(_conn) -> Dict:
+    """Cached _read_sheet for display. The connection is excluded from the cache key."""
+    return _read_sheet(_conn)
+
+
+class DashboardFrame(NamedTuple):
+    """Everything the Analytics page needs, built from a single load."""
+    stats: Dict[str, float]
+    range_df: pd.DataFrame
+    processed_df: pd.DataFrame
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_dashboard_frame(_manager: "DataManager", version: int, today: str,
+                        days: int = 8) -> DashboardFrame:
+    """
+    Build the Analytics page data once per data version.
+    `version` (see DataManager.data_version) and `today` only key the cache.
+    """
+    from utils import convert_to_dataframe
+    return DashboardFrame(
+        stats=_manager.get_statistics(),
+        range_df=convert_to_dataframe(_manager.get_date_range(days)),
+        processed_df=_manager.get_processed_data()
+    )
+
+
 class DataManager:
     def __init__(self):
         self.data_file = DATA_FILE
         self.use_cloud = False
         self.conn = None
+        self._version = 0  # bumped on every successful save
+        # In-memory copy of the local store, invalidated when the file's mtime changes
+        self._data: Optional[Dict] = None
+        self._data_mtime: Optional[int] = None
+        self._n_lines = 0  # lines in the local log, live or superseded
+        # The instance is shared by all sessions (st.cache_resource); reentrant because
+        # loading and appending may compact through save_data
+        self._lock = threading.RLock()
         
         # Check if we should try cloud storage
         # 1. Dependency exists
         # 2. Secrets exist (specifically 'connections.gsheets' or 'gcp_service_account')
         try:
-             if HAS_GSHEETS and "connections" in st.secrets and "gsheets" in st.secrets["connections"]:
+             # load_if_toml_exists avoids Streamlit rendering a "No secrets files found" error locally
+             if (HAS_GSHEETS and st.secrets.load_if_toml_exists()
+                     and "connections" in st.secrets and "gsheets" in st.secrets["connections"]):
                 try:
                     self.conn = st.connection("gsheets", type=GSheetsConnection)
                     self.use_cloud = True
@@ -45,120 +142,219 @@ class DataManager:
             self._ensure_data_file()
 
     def _ensure_data_file(self):
-        """Ensure local data file exists with valid JSON."""
-        if not self.data_file.exists():
-            self.save_data({})
-        else:
+        """Ensure the local data log exists, migrating the old JSON store if present."""
+        if self.data_file.exists():
+            return
+        data = {}
+        if LEGACY_DATA_FILE.exists():
             try:
-                # Just verify it loads
-                with open(self.data_file, 'r') as f:
-                    json.load(f)
+                with open(LEGACY_DATA_FILE, 'rb') as f:
+                    data = json_loads(f.read())
+                logger.info(f"Migrated {len(data)} entries from {LEGACY_DATA_FILE}")
             except json.JSONDecodeError:
-                logger.error("Corrupted data file found. Backing up and resetting.")
-                self.data_file.rename(self.data_file.with_suffix('.bak'))
-                self.save_data({})
+                logger.error(f"Corrupted legacy data file {LEGACY_DATA_FILE}; starting empty.")
+        self.save_data(data)
 
-    def load_data(self) -> Dict:
-        """Load data from either Google Sheets or local JSON."""
-        if self.use_cloud:
+    def _needs_compaction(self, n_bad: int = 0) -> bool:
+        """True once superseded/broken lines outnumber live entries (and COMPACT_MIN_STALE)."""
+        n_live = len(self._data)
+        return bool(n_bad) or self._n_lines - n_live > max(n_live, COMPACT_MIN_STALE)
+
+    def _append_records(self, records: Dict[str, Optional[Dict]]) -> bool:
+        """
+        Append one line to the local log and apply it to the in-memory copy;
+        a None entry marks a deletion. Call after _load_data().
+        """
+        with self._lock:
             try:
-                # Read from Sheet 1. Expected format: Date col, other cols.
-                df = self.conn.read(worksheet="Sheet1", ttl=0) # ttl=0 for fresh data
-                if df.empty:
-                    return {}
-                
-                # Convert DF back to Dict logic {date: {row_data}}
-                # Ensure date column is string
-                if 'date' not in df.columns:
-                    logger.warning("Google Sheet missing 'date' column.")
+                with open(self.data_file, 'ab') as f:
+                    f.write(json_dumps(records) + b'\n')
+                _load_local.clear()
+                self._version += 1
+            except Exception as e:
+                logger.error(f"Error saving local data: {e}")
+                self._data = None
+                return False
+
+            if self._data is None:
+                # No trusted in-memory copy; the next load re-reads the file
+                return True
+            for date, entry in records.items():
+                if entry is None:
+                    self._data.pop(date, None)
+                else:
+                    self._data[date] = entry
+            self._n_lines += 1
+            try:
+                self._data_mtime = self.data_file.stat().st_mtime_ns
+            except OSError:
+                self._data = None
+                return True
+
+            # A long-running server rarely re-reads its own log, so vacuum here too
+            if self._needs_compaction():
+                logger.info(f"Compacting {self.data_file} ({self._n_lines} lines, {len(self._data)} entries)")
+                self.save_data(self._data)
+            return True
+
+    def load_data(self) -> Dict:
+        """Load data from either Google Sheets or the local NDJSON log.
+
+        Reads are cached across reruns. Local data is kept in memory and only
+        re-read when the file's mtime changes; every successful save clears the cache.
+        Returns a copy, so changes only reach storage through save_entry/delete_entry.
+        """
+        return dict(self._load_data())
+
+    def _load_data(self) -> Dict:
+        """load_data without the copy: the shared in-memory store, for read-only use."""
+        with self._lock:
+            if self.use_cloud:
+                try:
+                    return _load_cloud(self.conn)
+                except Exception as e:
+                    logger.error(f"Cloud load failed: {e}. Returning empty.")
+                    return {} # Return empty on failure to prevent crashing
+            else:
+                # Local fallback
+                try:
+                    mtime = self.data_file.stat().st_mtime_ns
+                    if self._data is not None and mtime == self._data_mtime:
+                        return self._data
+
+                    data, n_lines, n_bad = _load_local(str(self.data_file), mtime)
+                    self._data = data
+                    self._data_mtime = mtime
+                    self._n_lines = n_lines
+                    # Vacuum superseded/broken lines so the log doesn't grow without bound
+                    if self._needs_compaction(n_bad):
+                        logger.info(f"Compacting {self.data_file} ({n_lines} lines, {len(data)} entries)")
+                        self.save_data(data)
+                    return data
+                except Exception as e:
+                    logger.error(f"Error loading local data: {e}")
+                    self._data = None
                     return {}
-                
-                df['date'] = df['date'].astype(str)
-                # Convert to records
-                records = df.to_dict('records')
-                # Map to {date: record}
-                data_dict = {row['date']: row for row in records}
-                return data_dict
 
-            except Exception as e:
-                logger.error(f"Cloud load failed: {e}. Returning empty.")
-                return {} # Return empty on failure to prevent crashing
-        else:
-            # Local fallback
+    def data_version(self) -> int:
+        """Cheap token that changes whenever the stored data changes."""
+        if not self.use_cloud:
             try:
-                with open(self.data_file, 'r') as f:
-                    return json.load(f)
-            except Exception as e:
-                logger.error(f"Error loading local data: {e}")
-                return {}
+                return self.data_file.stat().st_mtime_ns
+            except OSError:
+                pass
+        return self._version
 
     def save_data(self, data: Dict) -> bool:
-        """Save data to storage."""
-        if self.use_cloud:
-            try:
-                # Convert Dict {date: {row}} back to DataFrame
-                df = pd.DataFrame(list(data.values()))
+        """Save the full dataset to storage (locally this also compacts the log)."""
+        with self._lock:
+            if self.use_cloud:
+                try:
+                    # Convert Dict {date: {row}} back to DataFrame
+                    df = pd.DataFrame(list(data.values()))
                 
-                # Ensure date is first column for readability
-                if 'date' in df.columns:
-                    cols = ['date'] + [c for c in df.columns if c != 'date']
-                    df = df[cols]
+                    # Ensure date is first column for readability
+                    if 'date' in df.columns:
+                        cols = ['date'] + [c for c in df.columns if c != 'date']
+                        df = df[cols]
                 
-                # Update the sheet
-                self.conn.update(worksheet="Sheet1", data=df)
-                return True
-            except Exception as e:
-                logger.error(f"Cloud save failed: {e}")
-                st.error("Failed to save to Cloud Database.")
-                return False
-        else:
-            try:
-                with open(self.data_file, 'w') as f:
-                    json.dump(data, f, indent=2)
-                return True
-            except Exception as e:
-                logger.error(f"Error saving local data: {e}")
-                return False
+                    # Update the sheet
+                    self.conn.update(worksheet="Sheet1", data=df)
+                    _load_cloud.clear()
+                    self._version += 1
+                    return True
+                except Exception as e:
+                    logger.error(f"Cloud save failed: {e}")
+                    st.error("Failed to save to Cloud Database.")
+                    return False
+            else:
+                tmp_path = None
+                try:
+                    # Write to a sibling temp file and swap it in, so a crash mid-write
+                    # never leaves a truncated data file behind.
+                    with tempfile.NamedTemporaryFile('wb', dir=self.data_file.parent,
+                                                     suffix='.tmp', delete=False) as f:
+                        tmp_path = f.name
+                        f.write(b"".join(json_dumps({date: entry}) + b"\n"
+                                         for date, entry in data.items()))
+                    os.replace(tmp_path, self.data_file)
+                    _load_local.clear()
+                    # What we just wrote is the new in-memory copy; no re-read needed
+                    self._data = data
+                    self._data_mtime = self.data_file.stat().st_mtime_ns
+                    self._n_lines = len(data)
+                    self._version += 1
+                    return True
+                except Exception as e:
+                    logger.error(f"Error saving local data: {e}")
+                    self._data = None
+                    if tmp_path and os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    return False
+
+    def _read_cloud_for_write(self) -> Optional[Dict]:
+        """
+        Fresh (uncached) read of the sheet to base a rewrite on. The GSheets connection
+        only offers whole-worksheet updates, so writing from the cached read could
+        overwrite edits made in the Sheet since. None if the read failed.
+        """
+        try:
+            return _read_sheet(self.conn)
+        except Exception as e:
+            logger.error(f"Cloud read before write failed: {e}")
+            st.error("Failed to read the Cloud Database; nothing was saved.")
+            return None
 
     def save_entry(self, date: str, entry: Dict) -> bool:
         """Save a single day's entry."""
-        # For efficiency in a real app, we might just append a row.
-        # But for simplicity and consistency with the dict structure, we load-update-save.
-        # Google Sheets API is fast enough for this scale.
-        data = self.load_data()
-        data[date] = entry
         logger.info(f"Saving entry for {date} (Cloud: {self.use_cloud})")
-        return self.save_data(data)
+        if self.use_cloud:
+            # Hold the lock from read to rewrite so concurrent sessions don't drop each other's rows
+            with self._lock:
+                data = self._read_cloud_for_write()
+                if data is None:
+                    return False
+                data[date] = entry
+                return self.save_data(data)
+
+        self._load_data()
+        # Locally a save is a single appended line, whatever the history size
+        return self._append_records({date: entry})
 
     def get_entry(self, date: str) -> Dict:
         """Retrieve a specific day's entry."""
-        data = self.load_data()
+        data = self._load_data()
         return data.get(date, {})
 
+    def get_entries(self, dates: List[str]) -> Dict[str, Dict]:
+        """Retrieve several days' entries with a single load ({} for missing days)."""
+        data = self._load_data()
+        return {d: data.get(d, {}) for d in dates}
+
     def get_date_range(self, days: int) -> Dict:
         """Get data for the last N days."""
-        data = self.load_data()
+        data = self._load_data()
         from utils import get_date_range
         dates = get_date_range(days)
         return {d: data.get(d) for d in dates if d in data}
 
     def get_statistics(self) -> Dict[str, float]:
         """Calculate basic statistics from data."""
-        data = self.load_data()
+        data = self._load_data()
         if not data:
             return {"avg_severity": 0.0, "avg_sleep": 0.0, "avg_stress": 0.0}
-            
-        total_entries = len(data)
-        
-        avg_severity = sum(float(d.get('symptom_severity', 0)) for d in data.values()) / total_entries
-        avg_sleep = sum(float(d.get('sleep_hours', 0)) for d in data.values()) / total_entries
-        avg_stress = sum(float(d.get('stress_level', 0)) for d in data.values()) / total_entries
-        
-        return {
-            "avg_severity": round(avg_severity, 1),
-            "avg_sleep": round(avg_sleep, 1),
-            "avg_stress": round(avg_stress, 1)
+
+        from utils import convert_to_dataframe
+        stat_cols = {
+            'symptom_severity': 'avg_severity',
+            'sleep_hours': 'avg_sleep',
+            'stress_level': 'avg_stress'
         }
+        # Missing values count as 0, matching the per-entry averages over all days
+        df = convert_to_dataframe(data).reindex(columns=list(stat_cols))
+        means = df.apply(pd.to_numeric, errors='coerce').fillna(0).mean().round(1)
+
+        return {key: float(means[col]) for col, key in stat_cols.items()}
     
     def get_processed_data(self) -> pd.DataFrame:
         """
@@ -166,39 +362,49 @@ class DataManager:
         - Rolling averages
         - Lagged features
         """
-        data = self.load_data()
+        data = self._load_data()
         from utils import convert_to_dataframe
         df = convert_to_dataframe(data)
         
         if df.empty:
             return df
             
-        # Ensure correct types
+        # Ensure correct types: one coercion pass, stored as float32 (plenty for 1-10 scales)
         cols_to_numeric = ['symptom_severity', 'sleep_hours', 'stress_level', 'exercise']
-        for col in cols_to_numeric:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+        existing = [c for c in cols_to_numeric if c in df.columns]
+        df[existing] = df[existing].apply(pd.to_numeric, errors='coerce').astype('float32')
 
+        features = []
         # 1. Rolling Averages (Trend Analysis)
-        if len(df) >= 3: 
-            df['severity_7d_avg'] = df['symptom_severity'].rolling(window=7, min_periods=1).mean()
-            df['stress_7d_avg'] = df['stress_level'].rolling(window=7, min_periods=1).mean()
+        if len(df) >= 3:
+            rolling_cols = {'symptom_severity': 'severity_7d_avg', 'stress_level': 'stress_7d_avg'}
+            present = [c for c in rolling_cols if c in df.columns]
+            # rolling().mean() always yields float64; keep the features float32 like their inputs
+            features.append(df[present].rolling(window=7, min_periods=1).mean()
+                            .astype('float32').rename(columns=rolling_cols))
         
         # 2. Lagged Features (Causal Analysis)
-        if 'stress_level' in df.columns:
-            df['stress_lag1'] = df['stress_level'].shift(1)
-        if 'sleep_hours' in df.columns:
-            df['sleep_lag1'] = df['sleep_hours'].shift(1)
-        if 'symptom_severity' in df.columns:
-            df['severity_lag1'] = df['symptom_severity'].shift(1)
+        lag_cols = {'stress_level': 'stress_lag1', 'sleep_hours': 'sleep_lag1', 'symptom_severity': 'severity_lag1'}
+        present = [c for c in lag_cols if c in df.columns]
+        features.append(df[present].shift(1).rename(columns=lag_cols))
+
+        # One concat instead of a column insert per feature
+        df = pd.concat([df, *features], axis=1)
 
         return df
 
     def delete_entry(self, date: str) -> bool:
         """Remove an entry."""
-        data = self.load_data()
-        if date in data:
-            del data[date]
-            logger.info(f"Deleted entry for {date}")
-            return self.save_data(data)
-        return False
+        if self.use_cloud:
+            with self._lock:
+                data = self._read_cloud_for_write()
+                if data is None or date not in data:
+                    return False
+                logger.info(f"Deleted entry for {date}")
+                del data[date]
+                return self.save_data(data)
+
+        if date not in self._load_data():
+            return False
+        logger.info(f"Deleted entry for {date}")
+        return self._append_records({date: None})
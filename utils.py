@@ -1,26 +1,33 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 import pandas as pd
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, Union
+# orjson is much faster for the data store, but stdlib json keeps things working without it
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    import json
+    HAS_ORJSON = False
 
 def get_today_key() -> str:
     """Returns today's date in YYYY-MM-DD format."""
     return datetime.now().strftime("%Y-%m-%d")
 
 def get_date_range(days: int) -> List[str]:
-    """Returns a list of date strings for the last N days."""
-    dates = []
-    for i in range(days):
-        date = datetime.now() - timedelta(days=i)
-        dates.append(date.strftime("%Y-%m-%d"))
-    return dates
-
-def get_trigger_foods(data: Dict, threshold: int = 6) -> Dict:
-    """Identify meals eaten on high-symptom days."""
-    trigger_foods = {}
-    for date, entry in data.items():
-        if entry.get("symptom_severity", 0) >= threshold:
-            trigger_foods[date] = entry.get("meals", "No meals recorded")
-    return trigger_foods
+    """Returns a list of date strings for the last N days, newest first."""
+    if days <= 0:
+        return []
+    today = pd.Timestamp.now().normalize()
+    return pd.date_range(end=today, periods=days).strftime("%Y-%m-%d").tolist()[::-1]
+
+def get_trigger_foods(df: pd.DataFrame, threshold: int = 6) -> Dict:
+    """Identify meals eaten on high-symptom days (newest first)."""
+    if df.empty or "symptom_severity" not in df.columns:
+        return {}
+    severity = pd.to_numeric(df["symptom_severity"], errors="coerce")
+    meals = df["meals"] if "meals" in df.columns else pd.Series(index=df.index, dtype=object)
+    high_days = meals[severity >= threshold].fillna("No meals recorded")
+    return high_days.sort_index(ascending=False).to_dict()
 
 def convert_to_dataframe(data: Dict) -> pd.DataFrame:
     """Convert JSON data to pandas DataFrame."""
@@ -30,10 +37,29 @@ def convert_to_dataframe(data: Dict) -> pd.DataFrame:
     df.index.name = 'date'
     return df.sort_index()
 
-def get_csv_export(data: Dict) -> str:
-    """Convert data to CSV string."""
+def get_csv_export(data: Dict) -> bytes:
+    """Convert data to UTF-8 CSV bytes (what st.download_button sends anyway)."""
     df = convert_to_dataframe(data)
-    return df.to_csv()
+    return df.to_csv().encode()
+
+def json_loads(raw: Union[bytes, str]) -> Any:
+    """Parse JSON bytes/str, using orjson when available."""
+    if HAS_ORJSON:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+def json_dumps(obj: Any, indent: bool = False, sort_keys: bool = False) -> bytes:
+    """Serialize to UTF-8 JSON bytes, using orjson when available."""
+    if HAS_ORJSON:
+        option = orjson.OPT_SERIALIZE_NUMPY
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, option=option, default=str)
+    separators = None if indent else (",", ":")
+    return json.dumps(obj, indent=2 if indent else None, sort_keys=sort_keys,
+                      separators=separators, default=str).encode()
 
 def get_severity_color(severity: int) -> str:
     """Returns an emoji indicator based on severity."""
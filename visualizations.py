@@ -1,144 +1,460 @@
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+import numpy as np
 import plotly.graph_objects as go
 import plotly.express as px
+import plotly.io as pio
+from plotly.subplots import make_subplots
 import pandas as pd
-from typing import Dict, Any, List
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from utils import HAS_ORJSON
+# Downsampling is optional; without it long histories are simply sent in full
+try:
+    from tsdownsample import MinMaxLTTBDownsampler
+    HAS_TSDOWNSAMPLE = True
+except ImportError:
+    HAS_TSDOWNSAMPLE = False
+
+# st.plotly_chart serializes through pio.to_json; orjson encodes numpy arrays natively
+if HAS_ORJSON:
+    pio.json.config.default_engine = "orjson"
+
+# Figures kept per chart type, keyed on a fingerprint of the input data
+FIGURE_CACHE_SIZE = 32
+
+# Time series longer than this are thinned to about DOWNSAMPLE_POINTS per metric
+DOWNSAMPLE_THRESHOLD = 2000
+DOWNSAMPLE_POINTS = 1000
+
+# Below this many rows the matrix path beats the one-off JIT compile of the Numba kernel
+NUMBA_MIN_ROWS = 2000
+
+# A variance below this fraction of the raw sum of squares is rounding noise
+# (e.g. a constant 0.1 column), so the column counts as constant
+VAR_RTOL = 1e-12
+
+# Metric columns the charts read; stored as Arrow-backed float32 once on ingress
+NUMERIC_COLUMNS = ('symptom_severity', 'sleep_hours', 'sleep_quality', 'stress_level', 'exercise')
+
+# Lag columns derived when the caller didn't supply them: {lag column: source column}
+LAG_COLUMNS = {'stress_lag1': 'stress_level', 'sleep_lag1': 'sleep_hours'}
+LAG_CACHE_SIZE = 8
+
+
+def _pairwise_corr(mat: np.ndarray) -> np.ndarray:
+    """
+    Pearson correlation between the columns of `mat`, using for each pair only the
+    rows where both values are present (same result as DataFrame.corr()).
+    All pairwise sums come from a handful of matrix products instead of a
+    Python-level loop over column pairs.
+    """
+    valid = ~np.isnan(mat)
+    m = valid.astype(np.float64)
+    # Center each column on its mean first; the one-pass sums below cancel badly otherwise
+    mu = np.where(valid, mat, 0.0).sum(axis=0) / np.maximum(m.sum(axis=0), 1.0)
+    x = np.where(valid, mat - mu, 0.0)
+
+    n = m.T @ m                  # rows where both columns are present
+    sx = x.T @ m                 # sum of column i over those rows
+    sxx = (x * x).T @ m          # sum of squares of column i over those rows
+    sxy = x.T @ x
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sxy - sx * sx.T / n
+        var = sxx - sx * sx / n
+        corr = cov / np.sqrt(var * var.T)
+    # Sum of squares of the uncentered values, to tell a constant column from rounding noise
+    mu = mu[:, None]
+    constant = var <= VAR_RTOL * (sxx + mu * (2.0 * sx + n * mu))
+    corr[(n < 2) | constant | constant.T] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+@functools.lru_cache(maxsize=None)
+def _numba_kernel() -> Optional[Callable]:
+    """
+    Import Numba and build the target-correlation kernel on first use (None without Numba).
+    Numba is optional and slow to import, so short histories never pay for it.
+    """
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+
+    # No fastmath: it lets LLVM assume NaN never occurs, which would drop the isnan checks
+    @njit(parallel=True)
+    def kernel(target: np.ndarray, feats: np.ndarray) -> np.ndarray:
+        """Pairwise-complete Pearson correlation of `target` with each row of `feats`, fused into one pass per row."""
+        out = np.empty(feats.shape[0])
+        for j in prange(feats.shape[0]):
+            sx = sy = sxx = syy = sxy = 0.0
+            n = 0
+            for i in range(target.shape[0]):
+                a = target[i]
+                b = feats[j, i]
+                if np.isnan(a) or np.isnan(b):
+                    continue
+                sx += a
+                sy += b
+                sxx += a * a
+                syy += b * b
+                sxy += a * b
+                n += 1
+            varx = n * sxx - sx * sx
+            vary = n * syy - sy * sy
+            # Relative test: rounding leaves constant non-representable values a tiny variance
+            if n < 2 or varx <= VAR_RTOL * n * sxx or vary <= VAR_RTOL * n * syy:
+                out[j] = np.nan
+            else:
+                out[j] = min(1.0, max(-1.0, (n * sxy - sx * sy) / np.sqrt(varx * vary)))
+        return out
+
+    return kernel
+
+
+def _target_corr(mat: np.ndarray) -> np.ndarray:
+    """Correlation of column 0 of `mat` with each of the other columns (pairwise-complete)."""
+    kernel = _numba_kernel() if len(mat) >= NUMBA_MIN_ROWS else None
+    if kernel is not None:
+        # Feature-major copy so each parallel iteration scans contiguous memory
+        return kernel(mat[:, 0], np.ascontiguousarray(mat[:, 1:].T))
+    return _pairwise_corr(mat)[0, 1:]
+
+
+def _fingerprint(data: pd.DataFrame, columns: Tuple[str, ...]) -> tuple:
+    """Cache key for a chart: which of its columns exist, their dtypes, and a hash of their values and index."""
+    available = frozenset(data.columns)
+    present = [c for c in columns if c in available]
+    key = (tuple(present), tuple(str(data[c].dtype) for c in present), len(data))
+    if not present or data.empty:
+        return key
+    hashed = pd.util.hash_pandas_object(data[present], index=True).to_numpy()
+    return key + (hashlib.blake2b(hashed.tobytes(), digest_size=16).digest(),)
+
+
+def _downsample(data: pd.DataFrame, columns: Tuple[str, ...]) -> pd.DataFrame:
+    """
+    Keep only the rows MinMaxLTTB selects for each of `columns`, so very long
+    histories send a bounded number of points while keeping their visual shape.
+    """
+    if not HAS_TSDOWNSAMPLE or len(data) <= DOWNSAMPLE_THRESHOLD:
+        return data
+    try:
+        x = pd.to_datetime(data.index).asi8
+    except (ValueError, TypeError):
+        x = np.arange(len(data), dtype=np.int64)
+
+    keep = np.zeros(len(data), dtype=bool)
+    available = frozenset(data.columns)
+    for col in columns:
+        if col not in available:
+            continue
+        y = data[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = np.flatnonzero(~np.isnan(y))
+        if len(valid) <= DOWNSAMPLE_POINTS:
+            keep[valid] = True
+            continue
+        picked = MinMaxLTTBDownsampler().downsample(x[valid], y[valid], n_out=DOWNSAMPLE_POINTS)
+        keep[valid[picked.astype(np.intp)]] = True
+    return data[keep]
+
+
+def _date_axis(index: pd.Index) -> np.ndarray:
+    """
+    x values for a date series as a plain array of 'YYYY-MM-DD' strings, converted
+    once and shared by every trace of a chart. Datetime input is formatted to days:
+    Plotly would otherwise send each point as 'YYYY-MM-DDT00:00:00'.
+    """
+    if isinstance(index, pd.DatetimeIndex):
+        index = index.strftime('%Y-%m-%d')
+    return index.to_numpy()
+
+
+def _memoize_figure(*columns: str):
+    """
+    Reuse the figure built for identical input instead of rebuilding (and
+    re-validating) it on every rerun. `columns` are the columns the chart reads.
+    Cached figures are shared, so callers must treat them as read-only.
+    """
+    def decorator(method):
+        cache: "OrderedDict[tuple, go.Figure]" = OrderedDict()
+        lock = threading.Lock()
+
+        @functools.wraps(method)
+        def wrapper(self, data: pd.DataFrame) -> go.Figure:
+            key = _fingerprint(data, columns)
+            with lock:
+                if key in cache:
+                    cache.move_to_end(key)
+                    return cache[key]
+            fig = method(self, data)
+            with lock:
+                cache[key] = fig
+                if len(cache) > FIGURE_CACHE_SIZE:
+                    cache.popitem(last=False)
+            return fig
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
+
+
+@functools.lru_cache(maxsize=8)
+def _empty_figure(message: str) -> go.Figure:
+    """
+    Placeholder figure showing `message`, built once per message. Like the chart
+    caches it is shared rather than copied: copying a Figure re-validates it and
+    costs more than building a new one.
+    """
+    fig = go.Figure()
+    fig.update_layout(
+        xaxis={"visible": False},
+        yaxis={"visible": False},
+        annotations=[
+            {
+                "text": message,
+                "xref": "paper",
+                "yref": "paper",
+                "showarrow": False,
+                "font": {"size": 20}
+            }
+        ]
+    )
+    return fig
+
 
 class Visualizer:
-    def create_symptom_chart(self, data: pd.DataFrame) -> go.Figure:
-        """Create interactive symptom severity trend chart."""
-        if data.empty or 'symptom_severity' not in data.columns:
-            return self._create_empty_figure("No Data Available")
+    # Layout shared by every chart; each create_* merges its own keys on top
+    _BASE_LAYOUT = {"template": "plotly_white", "height": 400}
 
-        fig = go.Figure()
-        
-        # Add line trace with fill
-        fig.add_trace(go.Scatter(
-            x=data.index,
-            y=data['symptom_severity'],
+    def __init__(self):
+        # Derived lag columns, keyed on a fingerprint of their source columns
+        self._lag_cache: "OrderedDict[tuple, pd.DataFrame]" = OrderedDict()
+        self._lag_lock = threading.Lock()
+
+    def _prepare(self, data: pd.DataFrame) -> pd.DataFrame:
+        """
+        Return a copy with the metric (and any lag) columns coerced to 'float32[pyarrow]'.
+        Arrow keeps values and nulls in contiguous buffers at half the width of
+        float64. Hand Plotly to_numpy(..., na_value=np.nan) arrays, never the Series:
+        with any null it would become an object array of pd.NA and lose typed encoding.
+        """
+        columns = frozenset(data.columns)
+        present = [c for c in (*NUMERIC_COLUMNS, *LAG_COLUMNS) if c in columns]
+        return data.assign(**{c: pd.to_numeric(data[c], errors='coerce').astype('float32[pyarrow]')
+                              for c in present})
+
+    def _with_lags(self, data: pd.DataFrame) -> pd.DataFrame:
+        """Add any missing LAG_COLUMNS, reusing the shift computed for identical source data."""
+        columns = frozenset(data.columns)
+        missing = {lag: src for lag, src in LAG_COLUMNS.items()
+                   if lag not in columns and src in columns}
+        if not missing:
+            return data
+
+        key = _fingerprint(data, tuple(missing.values()))
+        with self._lag_lock:
+            lags = self._lag_cache.get(key)
+            if lags is not None:
+                self._lag_cache.move_to_end(key)
+        if lags is None:
+            lags = data[list(missing.values())].shift(1)
+            lags.columns = list(missing)
+            with self._lag_lock:
+                self._lag_cache[key] = lags
+                if len(self._lag_cache) > LAG_CACHE_SIZE:
+                    self._lag_cache.popitem(last=False)
+        return data.assign(**{c: lags[c] for c in missing})
+
+    def _add_symptom_traces(self, fig: go.Figure, row: Optional[int], col: Optional[int],
+                            data: pd.DataFrame) -> None:
+        """Severity line on the given subplot (row/col None for a plain Figure)."""
+        data = _downsample(data, ('symptom_severity',))
+
+        # Add line trace with fill (WebGL keeps long histories fast to render)
+        fig.add_trace(go.Scattergl(
+            x=_date_axis(data.index),
+            y=data['symptom_severity'].to_numpy(dtype=np.float32, na_value=np.nan),
             mode='lines+markers',
             fill='tozeroy',
             name='Severity',
             line=dict(color='#FF4B4B', width=3),
             marker=dict(size=8, color='#FF4B4B'),
             hovertemplate='<b>Date</b>: %{x}<br><b>Severity</b>: %{y}<extra></extra>'
-        ))
+        ), row=row, col=col)
+        fig.update_yaxes(title="Severity (1-10)", range=[0, 11], row=row, col=col)
 
-        fig.update_layout(
-            title="Symptom Severity Trend",
-            yaxis=dict(title="Severity (1-10)", range=[0, 11]),
-            xaxis=dict(title="Date", tickformat="%d %b"),
-            hovermode="x unified",
-            template="plotly_white",
-            height=400
-        )
-        return fig
-
-    def create_sleep_chart(self, data: pd.DataFrame) -> go.Figure:
-        """Create dual-axis sleep chart (hours vs quality)."""
-        if data.empty or 'sleep_hours' not in data.columns:
-            return self._create_empty_figure("No Data Available")
-
-        fig = go.Figure()
+    def _add_sleep_traces(self, fig: go.Figure, row: Optional[int], col: Optional[int],
+                          data: pd.DataFrame) -> None:
+        """Sleep hours bars plus quality on the subplot's secondary y-axis (needs a secondary_y spec)."""
+        data = _downsample(data, ('sleep_hours', 'sleep_quality'))
+        x_axis = _date_axis(data.index)
 
         # Bar chart for hours
         fig.add_trace(go.Bar(
-            x=data.index,
-            y=data['sleep_hours'],
+            x=x_axis,
+            y=data['sleep_hours'].to_numpy(dtype=np.float32, na_value=np.nan),
             name='Sleep Hours',
             marker_color='#4B9CFF',
             opacity=0.7,
             hovertemplate='<b>Hours</b>: %{y}<extra></extra>'
-        ))
+        ), row=row, col=col)
+        fig.update_yaxes(title="Hours", row=row, col=col, secondary_y=False)
 
         # Line chart for quality
         if 'sleep_quality' in data.columns:
-            fig.add_trace(go.Scatter(
-                x=data.index,
-                y=data['sleep_quality'],
+            fig.add_trace(go.Scattergl(
+                x=x_axis,
+                y=data['sleep_quality'].to_numpy(dtype=np.float32, na_value=np.nan),
                 name='Sleep Quality',
-                yaxis='y2',
                 mode='lines+markers',
                 line=dict(color='#FFB347', width=3),
                 marker=dict(symbol='square', size=8),
                 hovertemplate='<b>Quality</b>: %{y}/10<extra></extra>'
-            ))
-
-        fig.update_layout(
-            title="Sleep Duration & Quality",
-            yaxis=dict(title="Hours"),
-            yaxis2=dict(
-                title="Quality (1-10)",
-                overlaying='y',
-                side='right',
-                range=[0, 11]
-            ),
-            xaxis=dict(title="Date", tickformat="%d %b"),
-            barmode='group',
-            template="plotly_white",
-            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-            height=400
-        )
+            ), row=row, col=col, secondary_y=True)
+            fig.update_yaxes(title="Quality (1-10)", range=[0, 11], row=row, col=col, secondary_y=True)
+
+    def _add_stress_traces(self, fig: go.Figure, row: Optional[int], col: Optional[int],
+                           data: pd.DataFrame) -> None:
+        """Color-coded stress bars on the given subplot (row/col None for a plain Figure)."""
+        data = _downsample(data, ('stress_level',))
+
+        # Color generation (one vectorized pass; NaN falls through to the default)
+        stress = data['stress_level'].to_numpy(dtype=np.float32, na_value=np.nan)
+        colors = np.select([stress < 4, stress < 8], ['#4CAF50', '#FF9800'], default='#F44336').tolist()
+
+        fig.add_trace(go.Bar(
+            x=_date_axis(data.index),
+            y=stress,
+            marker_color=colors,
+            texttemplate='%{y:.0f}', # Labels are formatted client-side
+            textposition='auto',
+            name='Stress Level',
+            showlegend=False,
+            hovertemplate='<b>Stress Level</b>: %{y}/10<extra></extra>'
+        ), row=row, col=col)
+        fig.update_yaxes(title="Stress Level (1-10)", range=[0, 11], row=row, col=col)
+
+    @_memoize_figure('symptom_severity')
+    def create_symptom_chart(self, data: pd.DataFrame) -> go.Figure:
+        """Create interactive symptom severity trend chart."""
+        if data.empty or 'symptom_severity' not in data.columns:
+            return self._create_empty_figure("No Data Available")
+
+        fig = go.Figure()
+        self._add_symptom_traces(fig, None, None, self._prepare(data))
+        fig.update_layout({
+            **self._BASE_LAYOUT,
+            "title": "Symptom Severity Trend",
+            "xaxis": dict(title="Date", tickformat="%d %b"),
+            "hovermode": "x unified"
+        })
         return fig
 
+    @_memoize_figure('sleep_hours', 'sleep_quality')
+    def create_sleep_chart(self, data: pd.DataFrame) -> go.Figure:
+        """Create dual-axis sleep chart (hours vs quality)."""
+        if data.empty or 'sleep_hours' not in data.columns:
+            return self._create_empty_figure("No Data Available")
+
+        fig = make_subplots(specs=[[{"secondary_y": True}]])
+        self._add_sleep_traces(fig, 1, 1, self._prepare(data))
+        fig.update_layout({
+            **self._BASE_LAYOUT,
+            "title": "Sleep Duration & Quality",
+            "xaxis": dict(title="Date", tickformat="%d %b"),
+            "barmode": 'group',
+            "legend": dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+        })
+        return fig
+
+    @_memoize_figure('stress_level')
     def create_stress_chart(self, data: pd.DataFrame) -> go.Figure:
         """Create color-coded stress level chart."""
         if data.empty or 'stress_level' not in data.columns:
             return self._create_empty_figure("No Data Available")
 
-        # Color generation
-        colors = ['#4CAF50' if x < 4 else '#FF9800' if x < 8 else '#F44336' for x in data['stress_level']]
+        fig = go.Figure()
+        self._add_stress_traces(fig, None, None, self._prepare(data))
+        fig.update_layout({
+            **self._BASE_LAYOUT,
+            "title": "Daily Stress Levels",
+            "xaxis": dict(title="Date", tickformat="%d %b"),
+            "showlegend": False
+        })
+        return fig
 
-        fig = go.Figure(go.Bar(
-            x=data.index,
-            y=data['stress_level'],
-            marker_color=colors,
-            text=data['stress_level'],
-            textposition='auto',
-            name='Stress Level',
-            hovertemplate='<b>Stress Level</b>: %{y}/10<extra></extra>'
-        ))
+    @_memoize_figure('symptom_severity', 'sleep_hours', 'sleep_quality', 'stress_level')
+    def create_dashboard(self, data: pd.DataFrame) -> go.Figure:
+        """
+        Symptom, sleep and stress trends stacked on a shared date axis in one figure,
+        so the page validates, serializes and sends a single chart instead of three.
+        """
+        rows = [('symptom_severity', self._add_symptom_traces, "Symptom Severity Trend"),
+                ('sleep_hours', self._add_sleep_traces, "Sleep Duration & Quality"),
+                ('stress_level', self._add_stress_traces, "Daily Stress Levels")]
+        columns = frozenset(data.columns)
+        if data.empty or not any(col in columns for col, _, _ in rows):
+            return self._create_empty_figure("No Data Available")
 
-        fig.update_layout(
-            title="Daily Stress Levels",
-            yaxis=dict(title="Stress Level (1-10)", range=[0, 11]),
-            xaxis=dict(title="Date", tickformat="%d %b"),
-            template="plotly_white",
-            showlegend=False,
-            height=400
-        )
+        data = self._prepare(data)
+        fig = make_subplots(rows=len(rows), cols=1, shared_xaxes=True, vertical_spacing=0.08,
+                            subplot_titles=[title for _, _, title in rows],
+                            specs=[[{}], [{"secondary_y": True}], [{}]])
+        for i, (col, add_traces, _) in enumerate(rows, start=1):
+            if col in columns:
+                add_traces(fig, i, 1, data)
+
+        fig.update_xaxes(tickformat="%d %b")
+        fig.update_xaxes(title="Date", row=len(rows), col=1)
+        fig.update_layout({
+            **self._BASE_LAYOUT,
+            "height": 900,
+            "barmode": 'group',
+            "hovermode": "x unified",
+            "legend": dict(orientation="h", yanchor="bottom", y=1.04, xanchor="right", x=1)
+        })
         return fig
-        
+
+    @_memoize_figure('symptom_severity', 'sleep_hours', 'sleep_quality', 'stress_level', 'exercise')
     def create_correlation_heatmap(self, data: pd.DataFrame) -> go.Figure:
         """Create a correlation heatmap of key metrics."""
         if data.empty or len(data) < 3: # Need minimal data for correlation
             return self._create_empty_figure("Needs more data for correlation")
             
-        cols = ['symptom_severity', 'sleep_hours', 'sleep_quality', 'stress_level', 'exercise']
         # Filter for existing columns
-        valid_cols = [c for c in cols if c in data.columns]
+        columns = frozenset(data.columns)
+        valid_cols = [c for c in NUMERIC_COLUMNS if c in columns]
         
         if len(valid_cols) < 2:
              return self._create_empty_figure("Not enough metrics for correlation")
 
-        corr = data[valid_cols].corr()
+        mat = self._prepare(data)[valid_cols].to_numpy(dtype=np.float64, na_value=np.nan)
+        corr_vals = _pairwise_corr(mat)
+        # The matrix is symmetric: only send the lower triangle (gaps render empty)
+        tri = np.where(np.tri(len(valid_cols), dtype=bool), corr_vals, np.nan)
+        # Three decimals is all the colours and labels show; float32 halves the payload
+        z_vals = np.round(tri, 3).astype(np.float32)
         
         fig = go.Figure(data=go.Heatmap(
-            z=corr.values,
+            z=z_vals,
             x=valid_cols,
             y=valid_cols,
             colorscale='RdBu_r', # Red = positive correlation (bad for symptoms), Blue = negative
             zmin=-1, zmax=1,
-            text=corr.values,
-            texttemplate="%{text:.2f}"
+            texttemplate="%{z:.2f}", # Cell labels come from z; no duplicate text matrix
+            zsmooth=False,
+            hoverongaps=False
         ))
         
-        fig.update_layout(
-            title="Correlation Matrix (What affects what?)",
-            height=400,
-            template="plotly_white"
-        )
+        fig.update_layout({
+            **self._BASE_LAYOUT,
+            "title": "Correlation Matrix (What affects what?)"
+        })
         return fig
 
+    @_memoize_figure('symptom_severity', 'stress_level', 'stress_lag1', 'sleep_hours', 'sleep_lag1')
     def create_lagged_correlation_chart(self, data: pd.DataFrame) -> go.Figure:
         """
         Create a bar chart showing correlation of Today's Symptoms vs:
@@ -159,58 +475,44 @@ class Visualizer:
             'Sleep (Hours Today)': 'sleep_hours',
             'Sleep (Yesterday)': 'sleep_lag1'
         }
-        
-        correlations = {}
-        for label, col in features.items():
-            if col in data.columns:
-                # Calculate correlation, ignoring NaNs
-                corr = data[[target, col]].corr().iloc[0, 1]
-                correlations[label] = corr
-        
-        if not correlations:
+
+        # Derive yesterday's stress/sleep here if the caller didn't provide them
+        data = self._with_lags(self._prepare(data))
+        columns = frozenset(data.columns)
+        present = [(label, col) for label, col in features.items() if col in columns]
+        if not present:
              return self._create_empty_figure("Not enough matched data")
 
-        # Convert to DF for plotting
-        corr_df = pd.DataFrame(list(correlations.items()), columns=['Factor', 'Correlation'])
-        
+        cols = [target] + [col for _, col in present]
+        # Every column is numeric after _prepare, so this is one conversion with one NaN mask
+        mat = data[cols].to_numpy(dtype=np.float64, na_value=np.nan)
+        # One pass for every feature, ignoring NaNs pairwise; column 0 is the target
+        values = _target_corr(mat)
+        labels = [label for label, _ in present]
+
         # Color: Red for positive correlation (bad), Blue for negative (good/neutral)
-        corr_df['Color'] = ['#FF4B4B' if x > 0 else '#4B9CFF' for x in corr_df['Correlation']]
+        colors = np.where(values > 0, '#FF4B4B', '#4B9CFF').tolist()
 
         fig = go.Figure(go.Bar(
-            x=corr_df['Factor'],
-            y=corr_df['Correlation'],
-            marker_color=corr_df['Color'],
-            text=corr_df['Correlation'].apply(lambda x: f"{x:.2f}"),
+            x=labels,
+            y=values,
+            marker_color=colors,
+            texttemplate='%{y:.2f}',
             textposition='auto',
             hovertemplate='<b>%{x}</b><br>Correlation: %{y:.2f}<extra></extra>'
         ))
 
-        fig.update_layout(
-            title="Symptom Drivers: Today vs. Yesterday",
-            yaxis=dict(title="Correlation (-1 to +1)", range=[-1, 1]),
-            template="plotly_white",
-            height=400,
-            showlegend=False
-        )
+        fig.update_layout({
+            **self._BASE_LAYOUT,
+            "title": "Symptom Drivers: Today vs. Yesterday",
+            "yaxis": dict(title="Correlation (-1 to +1)", range=[-1, 1]),
+            "showlegend": False
+        })
         # Add interpretation line
         fig.add_hline(y=0, line_dash="solid", line_color="black", opacity=0.3)
         
         return fig
 
     def _create_empty_figure(self, message: str) -> go.Figure:
-        """Helper to create an empty figure with a message."""
-        fig = go.Figure()
-        fig.update_layout(
-            xaxis={"visible": False},
-            yaxis={"visible": False},
-            annotations=[
-                {
-                    "text": message,
-                    "xref": "paper",
-                    "yref": "paper",
-                    "showarrow": False,
-                    "font": {"size": 20}
-                }
-            ]
-        )
-        return fig
+        """Helper to create an empty figure with a message (shared, treat as read-only)."""
+        return _empty_figure(message)